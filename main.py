@@ -1,20 +1,129 @@
 from mcp.server.fastmcp import FastMCP, Context
-from sqlalchemy import create_engine, text, inspect
-from typing import Dict, Optional, Any
+from cachetools import LRUCache, TTLCache
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import create_engine, text, inspect, select, func, MetaData, Table
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.exc import ArgumentError
+from sqlalchemy.pool import StaticPool
+from typing import Dict, List, Literal, Optional, Any
+from urllib.parse import unquote
+import asyncio
+import base64
+import contextlib
+import copy
+import functools
+import itertools
+import os
+import pyarrow as pa
 import re
-import pandas as pd
+import sqlparse
 
 # Create the MCP server
 mcp = FastMCP(
     "SQL Explorer", 
-    dependencies=["sqlalchemy", "pandas", "pymysql", "psycopg2-binary", "pyodbc", "oracledb"]
+    dependencies=["sqlalchemy", "pyarrow", "cachetools", "sqlparse", "pymysql", "psycopg2-binary", "pyodbc", "oracledb"]
 )
 
-# Dictionary to store connections for reuse
-active_connections = {}
+# Connections stored for reuse, bounded so abandoned ones don't hold pools open
+# forever. connect_database evicts the least recently used one itself so its
+# engine can be disposed off the event loop
+MAX_ENGINES = int(os.getenv("MCP_SQL_MAX_ENGINES", "32"))
+active_connections = LRUCache(maxsize=MAX_ENGINES)
+
+# Display names of the supported database backends
+DB_TYPES = {
+    "mysql": "MySQL",
+    "postgresql": "PostgreSQL",
+    "sqlite": "SQLite",
+    "mssql": "SQL Server",
+    "oracle": "Oracle"
+}
+
+# Connection pool settings, overridable through the environment
+POOL_SIZE = int(os.getenv("MCP_SQL_POOL_SIZE", "10"))
+POOL_OVERFLOW = int(os.getenv("MCP_SQL_POOL_OVERFLOW", "20"))
+POOL_RECYCLE = 1800
+
+# Number of metadata queries describe_table runs concurrently
+METADATA_WORKERS = 4
+
+# Rows per executemany batch in bulk_insert, by dialect
+INSERT_BATCH_SIZES = {"mysql": 10_000, "postgresql": 1_000, "sqlite": 10_000, "duckdb": 10_000}
+DEFAULT_INSERT_BATCH_SIZE = 5_000
+
+# Recent SELECT results, keyed by connection epoch, normalized query, params and limit
+RESULT_CACHE_SIZE = int(os.getenv("MCP_SQL_RESULT_CACHE_SIZE", "256"))
+RESULT_CACHE_TTL = int(os.getenv("MCP_SQL_RESULT_CACHE_TTL", "60"))
+_RESULT_CACHE = TTLCache(maxsize=RESULT_CACHE_SIZE, ttl=RESULT_CACHE_TTL)
+
+# Source of cache epochs; a connection moves to a new epoch whenever it writes
+_EPOCHS = itertools.count()
+
+# Largest number of rows buffered from the cursor when streaming SELECT results
+MAX_CHUNK_SIZE = 10_000
+
+# Dialects that understand a trailing "LIMIT n" clause
+LIMIT_DIALECTS = {"mysql", "postgresql", "sqlite"}
+
+# Column listing for every table in the current PostgreSQL schema
+PG_COLUMNS_QUERY = """
+    SELECT table_name, column_name, data_type
+    FROM information_schema.columns
+    WHERE table_schema = current_schema()
+    ORDER BY table_name, ordinal_position
+"""
+
+# Row count estimates from catalog statistics, used instead of COUNT(*) where available
+_APPROX_COUNT = {
+    "postgresql": (
+        "SELECT reltuples::bigint FROM pg_class "
+        "WHERE relname = :t AND relnamespace = current_schema()::regnamespace"
+    ),
+    "mysql": (
+        "SELECT TABLE_ROWS FROM information_schema.TABLES "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :t"
+    )
+}
+
+# Matches the password portion of connection strings SQLAlchemy can't parse,
+# up to the last "@" so nothing of the password is ever left visible
+_PW_RE = re.compile(r'(://[^:@/]+:).+(@)')
+
+# Matches data-modifying statements inside a WITH query
+_DML_RE = re.compile(r'\b(insert|update|delete|merge)\b', re.IGNORECASE)
+
+# Matches anything that makes appending a LIMIT clause to a user query unsafe:
+# an existing row limit, a locking clause, a comment or a second statement
+_NO_LIMIT_RE = re.compile(
+    r'\b(limit|offset)\b|\bfetch\s+(first|next)\b|\bfor\s+(update|share)\b|--|/\*|#|;',
+    re.IGNORECASE
+)
+
+# Keywords that are reserved in every supported dialect, so uppercasing them
+# can't change an identifier or a result column name
+CANONICAL_KEYWORDS = {
+    "select", "from", "where", "and", "or", "not", "in", "is", "null", "as", "on",
+    "join", "order by", "group by", "having", "limit", "distinct", "union", "all",
+    "case", "when", "then", "else", "exists"
+}
+
+# Dialects whose result column names don't depend on how the query is spelled,
+# so equivalent spellings can share a cached result
+CANONICAL_DIALECTS = {"postgresql"}
+
+# Matches text whose meaning depends on the dialect's comment and escape rules:
+# backslash escapes, "#" comments or operators and block comments, which MySQL
+# can execute and PostgreSQL can nest
+_DIALECT_TEXT_RE = re.compile(r'\\|#|/\*')
+
+# Matches trailing whitespace and semicolons
+_TRAILING_RE = re.compile(r'[\s;]+$')
+
+# Leading keywords of statements that change the schema and invalidate cached metadata
+DDL_KEYWORDS = {"create", "alter", "drop", "truncate", "rename"}
 
 @mcp.tool()
-def connect_database(
+async def connect_database(
     connection_string: str,
     ctx: Context = None
 ) -> Dict[str, Any]:
@@ -33,15 +142,15 @@ def connect_database(
     try:
         # Log connection attempt (masking password for security)
         masked_connection = mask_password(connection_string)
-        ctx.info(f"Attempting to connect to database: {masked_connection}")
+        await ctx.info(f"Attempting to connect to database: {masked_connection}")
         
         # Check if connection string has the right format
-        if not (connection_string.startswith('mysql') or 
-                connection_string.startswith('postgresql') or
-                connection_string.startswith('postgres') or
-                connection_string.startswith('sqlite') or
-                connection_string.startswith('mssql') or
-                connection_string.startswith('oracle')):
+        try:
+            url = make_url(connection_string)
+        except ArgumentError:
+            url = None
+        
+        if url is None or url.get_backend_name() not in DB_TYPES:
             
             # Try to auto-correct the connection string if possible
             if "mysql" in connection_string.lower():
@@ -52,6 +161,7 @@ def connect_database(
             elif "postgre" in connection_string.lower():
                 if not connection_string.startswith('postgresql+psycopg2://'):
                     connection_string = connection_string.replace('postgresql://', 'postgresql+psycopg2://')
+                    connection_string = connection_string.replace('postgres://', 'postgresql+psycopg2://')
                     if not connection_string.startswith('postgresql+'):
                         connection_string = 'postgresql+psycopg2://' + connection_string
             # Simple pass-through for others or common alias corrections could go here
@@ -59,48 +169,58 @@ def connect_database(
                  connection_string = "sqlite:///" + connection_string # fallback helper, maybe risky
             
             # If still not matching known prefixes (strict check removed for flexibility, but let's keep basic validation)
-            if not any(connection_string.startswith(p) for p in ['mysql', 'postgres', 'sqlite', 'mssql', 'oracle']):
+            url = make_url(connection_string)
+            if url.get_backend_name() not in DB_TYPES:
                  # We'll try to let SQLAlchemy handle it, but warn/inform
-                 ctx.info("Connection string doesn't match common prefixes (mysql, postgresql, sqlite, mssql, oracle). Attempting anyway...")
+                 await ctx.info("Connection string doesn't match common prefixes (mysql, postgresql, sqlite, mssql, oracle). Attempting anyway...")
         
         # Create engine and connect
-        engine = create_engine(connection_string)
-        connection = engine.connect()
-        
-        # Determine database type
-        if "mysql" in connection_string.lower():
-            db_type = "MySQL"
-        elif "postgre" in connection_string.lower():
-            db_type = "PostgreSQL"
-        elif "sqlite" in connection_string.lower():
-            db_type = "SQLite"
-        elif "mssql" in connection_string.lower():
-            db_type = "SQL Server"
-        elif "oracle" in connection_string.lower():
-            db_type = "Oracle"
+        backend = url.get_backend_name()
+        if backend == 'sqlite':
+            # SQLite connections can't be pooled in the usual way, share a single one
+            engine = create_engine(
+                url,
+                poolclass=StaticPool,
+                connect_args={"check_same_thread": False}
+            )
         else:
-            db_type = "Unknown URL"
-        
-        # Get database inspector
-        inspector = inspect(engine)
+            engine = create_engine(
+                url,
+                pool_size=POOL_SIZE,
+                max_overflow=POOL_OVERFLOW,
+                pool_pre_ping=True,
+                pool_recycle=POOL_RECYCLE
+            )
         
-        # Get all tables
-        tables = inspector.get_table_names()
+        # Determine database type
+        db_type = DB_TYPES.get(backend, "Unknown URL")
         
-        # Get schema information for each table
-        schema_info = {}
-        for table in tables:
-            columns = inspector.get_columns(table)
-            schema_info[table] = [
-                {"name": col["name"], "type": str(col["type"])} 
-                for col in columns
-            ]
+        # Get database inspector, tables and schema information off the event loop
+        inspector, tables, schema_info = await asyncio.to_thread(_load_schema, engine)
         
         # Store connection for future use
         conn_id = masked_connection
+        
+        # Close the pool of a connection being replaced under the same ID
+        previous = active_connections.pop(conn_id, None)
+        if previous is not None:
+            await asyncio.to_thread(previous["engine"].dispose)
+        
+        # Make room by closing the least recently used connection
+        if len(active_connections) >= MAX_ENGINES:
+            await ctx.info(f"Connection limit of {MAX_ENGINES} reached, closing the least recently used connection")
+            evicted_id, evicted = active_connections.popitem()
+            invalidate_schema(evicted_id)
+            await asyncio.to_thread(evicted["engine"].dispose)
+        
+        # Reconnecting under the same ID must not reuse the old table descriptions
+        invalidate_schema(conn_id)
         active_connections[conn_id] = {
             "engine": engine,
-            "connection": connection,
+            "inspector": inspector,
+            # A StaticPool shares one connection, so calls on it must take turns
+            "lock": asyncio.Lock() if isinstance(engine.pool, StaticPool) else contextlib.nullcontext(),
+            "epoch": next(_EPOCHS),
             "type": db_type,
             "tables": tables,
             "schema": schema_info
@@ -120,11 +240,12 @@ def connect_database(
         }
 
 @mcp.tool()
-def execute_query(
+async def execute_query(
     connection_id: str,
     query: str,
     params: Optional[Dict[str, Any]] = None,
     limit: int = 100,
+    format: Literal["json", "arrow"] = "json",
     ctx: Context = None
 ) -> Dict[str, Any]:
     """
@@ -135,6 +256,8 @@ def execute_query(
         query: SQL query to execute
         params: Optional parameters for the query
         limit: Maximum number of rows to return (for SELECT queries)
+        format: "json" to return rows as dictionaries, or "arrow" to return them
+            as a base64-encoded Arrow IPC stream (for SELECT queries)
         
     Returns:
         Dictionary with query results or affected row count
@@ -146,46 +269,81 @@ def execute_query(
         }
     
     connection_info = active_connections[connection_id]
-    connection = connection_info["connection"]
+    engine = connection_info["engine"]
     
     try:
-        ctx.info(f"Executing query: {query[:100]}...")
+        if ctx:
+            await ctx.info(f"Executing query: {query[:100]}...")
         
-        # Check if it's a SELECT query
-        is_select = query.strip().lower().startswith("select")
+        # Plain SELECTs, including WITH queries that don't modify data, are
+        # read-only, so they can be cached, streamed and limited on the server
+        keyword = _leading_keyword(query)
+        is_select = keyword == "select" or (keyword == "with" and not _DML_RE.search(query))
         
         if is_select:
-            # For SELECT queries, use pandas to get results as a DataFrame
-            if params:
-                df = pd.read_sql(text(query), connection, params=params)
+            # Serve repeated queries from the result cache. Other dialects name
+            # unaliased columns after the query text, so only trim it for them
+            if engine.dialect.name in CANONICAL_DIALECTS:
+                query_text = _normalize(query)
             else:
-                df = pd.read_sql(text(query), connection)
-            
-            # Limit the number of rows
-            if limit > 0:
-                df = df.head(limit)
-            
-            # Convert to dictionary format
+                query_text = _TRAILING_RE.sub('', query.strip())
+            cache_key = (
+                connection_info["epoch"],
+                query_text,
+                repr(sorted((params or {}).items())),
+                limit,
+                format
+            )
+            cached = _copy_result(_RESULT_CACHE.get(cache_key))
+            if cached is not None:
+                return cached
+        
+        # Run the query in a worker thread so other requests keep being served
+        async with connection_info["lock"]:
+            columns, rows, affected_rows = await asyncio.to_thread(
+                _run_query, engine, query, params, limit, is_select
+            )
+        
+        if columns is None:
+            # Format results of statements that don't return rows
+            result = {
+                "success": True,
+                "is_select": False,
+                "affected_rows": affected_rows
+            }
+        elif format == "arrow":
+            # Pack the rows into a columnar Arrow stream
             result = {
                 "success": True,
                 "is_select": True,
-                "rows": df.to_dict(orient="records"),
-                "columns": df.columns.tolist(),
-                "row_count": len(df)
+                "format": "arrow",
+                "arrow_ipc_b64": await asyncio.to_thread(_to_arrow_ipc, columns, rows),
+                "columns": columns,
+                "row_count": len(rows)
             }
         else:
-            # For non-SELECT queries, execute directly
-            if params:
-                result_proxy = connection.execute(text(query), params)
-            else:
-                result_proxy = connection.execute(text(query))
-            
+            # Convert to dictionary format
             result = {
                 "success": True,
-                "is_select": False,
-                "affected_rows": result_proxy.rowcount
+                "is_select": True,
+                "rows": [dict(zip(columns, row)) for row in rows],
+                "columns": columns,
+                "row_count": len(rows)
             }
         
+        if is_select:
+            # Results that can't be copied are returned but not cached
+            cached = _copy_result(result)
+            if cached is not None:
+                _RESULT_CACHE[cache_key] = cached
+        else:
+            # Writes make cached results stale
+            connection_info["epoch"] = next(_EPOCHS)
+            
+            # Schema changes make cached table descriptions stale
+            if keyword in DDL_KEYWORDS:
+                invalidate_schema(connection_id)
+        
         return result
     except Exception as e:
         return {
@@ -193,6 +351,52 @@ def execute_query(
             "error": f"Query execution failed: {str(e)}"
         }
 
+@mcp.tool()
+async def bulk_insert(
+    connection_id: str,
+    table_name: str,
+    rows: List[Dict[str, Any]],
+    ctx: Context = None
+) -> Dict[str, Any]:
+    """
+    Insert many rows into a table in a single transaction.
+    
+    Args:
+        connection_id: Connection identifier returned from connect_database
+        table_name: Name of the table to insert into
+        rows: Rows to insert, each a dictionary of column names to values
+        
+    Returns:
+        Dictionary with the number of inserted rows and batches
+    """
+    if connection_id not in active_connections:
+        return {
+            "success": False,
+            "error": "Invalid connection ID. Please connect to the database first."
+        }
+    
+    connection_info = active_connections[connection_id]
+    
+    try:
+        await ctx.info(f"Inserting {len(rows)} rows into {table_name}...")
+        
+        async with connection_info["lock"]:
+            batches = await asyncio.to_thread(_insert_rows, connection_info["engine"], table_name, rows)
+        
+        # Writes make cached results stale
+        connection_info["epoch"] = next(_EPOCHS)
+        
+        return {
+            "success": True,
+            "inserted_rows": len(rows),
+            "batches": batches
+        }
+    except Exception as e:
+        return {
+            "success": False,
+            "error": f"Bulk insert failed: {str(e)}"
+        }
+
 @mcp.tool()
 def list_tables(
     connection_id: str,
@@ -223,7 +427,7 @@ def list_tables(
     }
 
 @mcp.tool()
-def describe_table(
+async def describe_table(
     connection_id: str,
     table_name: str,
     ctx: Context = None
@@ -245,23 +449,15 @@ def describe_table(
         }
     
     connection_info = active_connections[connection_id]
-    engine = connection_info["engine"]
     
     try:
-        # Get database inspector
-        inspector = inspect(engine)
-        
-        # Get column information
-        columns = inspector.get_columns(table_name)
-        
-        # Get primary key information
-        pk_columns = inspector.get_pk_constraint(table_name).get('constrained_columns', [])
-        
-        # Get foreign key information
-        foreign_keys = inspector.get_foreign_keys(table_name)
-        
-        # Get index information
-        indexes = inspector.get_indexes(table_name)
+        # Get column, primary key, foreign key and index information along with
+        # the row count, off the event loop
+        async with connection_info["lock"]:
+            (columns, pk_columns, foreign_keys, indexes), (row_count, row_count_approximate) = \
+                await asyncio.to_thread(
+                    _describe_with_row_count, connection_info["engine"], connection_info["inspector"], table_name
+                )
         
         # Format column information
         column_info = []
@@ -274,11 +470,6 @@ def describe_table(
                 "is_primary_key": col["name"] in pk_columns
             })
         
-        # Execute a sample query to get row count
-        query = text(f"SELECT COUNT(*) as count FROM {table_name}")
-        result = connection_info["connection"].execute(query).fetchone()
-        row_count = result[0] if result else 0
-        
         return {
             "success": True,
             "table_name": table_name,
@@ -286,7 +477,8 @@ def describe_table(
             "primary_keys": pk_columns,
             "foreign_keys": foreign_keys,
             "indexes": indexes,
-            "row_count": row_count
+            "row_count": row_count,
+            "row_count_approximate": row_count_approximate
         }
     except Exception as e:
         return {
@@ -295,7 +487,7 @@ def describe_table(
         }
 
 @mcp.tool()
-def disconnect(
+async def disconnect(
     connection_id: str,
     ctx: Context = None
 ) -> Dict[str, Any]:
@@ -315,14 +507,12 @@ def disconnect(
         }
     
     try:
-        connection_info = active_connections[connection_id]
-        connection = connection_info["connection"]
-        
-        # Close the connection
-        connection.close()
+        # Remove from active connections before awaiting, so no other call picks it up
+        invalidate_schema(connection_id)
+        connection_info = active_connections.pop(connection_id)
         
-        # Remove from active connections
-        del active_connections[connection_id]
+        # Close all pooled connections
+        await asyncio.to_thread(connection_info["engine"].dispose)
         
         return {
             "success": True,
@@ -348,23 +538,25 @@ def schema_resource(connection_id: str) -> str:
     connection_info = active_connections[connection_id]
     
     # Format as markdown
-    result = f"# {connection_info['type']} Database Schema\n\n"
-    result += f"## Tables ({len(connection_info['tables'])})\n\n"
+    parts = [
+        f"# {connection_info['type']} Database Schema\n\n",
+        f"## Tables ({len(connection_info['tables'])})\n\n"
+    ]
     
     for table_name in connection_info['tables']:
-        result += f"### {table_name}\n\n"
-        result += "| Column | Type | Description |\n"
-        result += "|--------|------|-------------|\n"
+        parts.append(f"### {table_name}\n\n")
+        parts.append("| Column | Type | Description |\n")
+        parts.append("|--------|------|-------------|\n")
         
         for column in connection_info['schema'][table_name]:
-            result += f"| {column['name']} | {column['type']} | |\n"
+            parts.append(f"| {column['name']} | {column['type']} | |\n")
         
-        result += "\n"
+        parts.append("\n")
     
-    return result
+    return "".join(parts)
 
 @mcp.resource("sql://query/{connection_id}/{query}")
-def query_resource(connection_id: str, query: str) -> str:
+async def query_resource(connection_id: str, query: str) -> str:
     """
     Execute a SQL query and return the results as a formatted resource.
     
@@ -376,38 +568,39 @@ def query_resource(connection_id: str, query: str) -> str:
         return "# Error\n\nInvalid connection ID. Please connect to the database first."
     
     # URL-decode the query
-    query = query.replace('%20', ' ').replace('%22', '"').replace('%27', "'")
+    query = unquote(query)
     
     # Execute the query
-    result = execute_query(connection_id, query, limit=20)
+    result = await execute_query(connection_id, query, limit=20)
     
     if not result["success"]:
         return f"# Error Executing Query\n\n{result['error']}"
     
-    # Format as markdown
-    output = "# SQL Query Results\n\n"
-    output += f"```sql\n{query}\n```\n\n"
+    # Format as markdown, showing the query in canonical form
+    parts = ["# SQL Query Results\n\n", f"```sql\n{_normalize(query)}\n```\n\n"]
     
     if result.get("is_select", False):
         # Format SELECT results as a table
         if result["row_count"] == 0:
-            output += "No results returned.\n"
+            parts.append("No results returned.\n")
         else:
+            columns = tuple(result["columns"])
+            
             # Create header row
-            output += "| " + " | ".join(result["columns"]) + " |\n"
-            output += "|" + "---|" * len(result["columns"]) + "\n"
+            parts.append("| " + " | ".join(columns) + " |\n")
+            parts.append("|" + "---|" * len(columns) + "\n")
             
             # Add data rows
             for row in result["rows"]:
-                output += "| " + " | ".join(str(row.get(col, "")) for col in result["columns"]) + " |\n"
+                parts.append("| " + " | ".join(map(str, (row.get(col, "") for col in columns))) + " |\n")
             
             if result["row_count"] >= 20:
-                output += "\n*Query limited to 20 rows. Use the execute_query tool for more results.*\n"
+                parts.append("\n*Query limited to 20 rows. Use the execute_query tool for more results.*\n")
     else:
         # Format non-SELECT results
-        output += f"**Affected rows:** {result['affected_rows']}\n"
+        parts.append(f"**Affected rows:** {result['affected_rows']}\n")
     
-    return output
+    return "".join(parts)
 
 @mcp.prompt()
 def connect_database_prompt(connection_string: str = "") -> str:
@@ -458,7 +651,224 @@ What would you like to do first?
 # Helper function to mask password in connection strings for logging
 def mask_password(connection_string: str) -> str:
     """Masks the password in a database connection string for security."""
-    return re.sub(r'(://.+:).+(@.+)', r'\1*****\2', connection_string)
+    try:
+        return make_url(connection_string).render_as_string(hide_password=True)
+    except (ArgumentError, ValueError):
+        return _PW_RE.sub(r'\1*****\2', connection_string)
+
+# Helper function to read a database's tables and their columns
+def _load_schema(engine) -> tuple:
+    """Returns (inspector, table names, columns per table) for a database."""
+    inspector = inspect(engine)
+    tables = inspector.get_table_names()
+    
+    # Get schema information for all tables in one pass instead of one
+    # roundtrip per table
+    if engine.dialect.name == "postgresql":
+        with engine.connect() as connection:
+            rows = connection.execute(text(PG_COLUMNS_QUERY)).fetchall()
+        columns_by_table = {
+            table: [{"name": row[1], "type": row[2]} for row in group]
+            for table, group in itertools.groupby(rows, key=lambda row: row[0])
+        }
+    else:
+        # Dialects with batched reflection answer this in one query, the rest
+        # fall back to one get_columns call per table
+        columns_by_table = {
+            name: [{"name": col["name"], "type": str(col["type"])} for col in columns]
+            for (_, name), columns in inspector.get_multi_columns(filter_names=tables).items()
+        }
+    schema_info = {table: columns_by_table.get(table, []) for table in tables}
+    return inspector, tables, schema_info
+
+# Helper function to run a query in its own transaction
+def _run_query(engine, query: str, params: Optional[Dict[str, Any]], limit: int, is_select: bool) -> tuple:
+    """Returns (column names, rows, None) for queries that return rows, reading at most
+    limit rows, or (None, None, affected row count) for other statements."""
+    # Check a connection out of the pool and commit on success
+    with engine.begin() as connection:
+        if is_select and limit > 0:
+            # Stream rows from a server-side cursor so we never hold more
+            # than one buffer beyond the limit in memory
+            connection = connection.execution_options(
+                stream_results=True, max_row_buffer=min(limit, MAX_CHUNK_SIZE)
+            )
+            
+            # Let the server stop sending rows once the limit is reached. When
+            # that isn't clearly safe, fetchmany(limit) below still caps the result
+            trimmed = _TRAILING_RE.sub('', query)
+            if connection.dialect.name in LIMIT_DIALECTS and not _NO_LIMIT_RE.search(trimmed):
+                query = f"{trimmed}\nLIMIT :__limit"
+                params = {"__limit": limit, **(params or {})}
+        
+        result_proxy = connection.execute(text(query), params or {})
+        if not result_proxy.returns_rows:
+            return None, None, result_proxy.rowcount
+        
+        # Read rows straight from the driver
+        columns = list(result_proxy.keys())
+        rows = result_proxy.fetchmany(limit) if limit > 0 else result_proxy.all()
+        
+        # Drivers such as psycopg2 return binary columns as memoryview,
+        # which can't be copied into the result cache
+        rows = [
+            tuple(bytes(value) if isinstance(value, memoryview) else value for value in row)
+            for row in rows
+        ]
+        
+        # Release a streaming cursor before the transaction ends
+        result_proxy.close()
+    return columns, rows, None
+
+# Helper function to insert rows in dialect-sized executemany batches
+def _insert_rows(engine, table_name: str, rows: list) -> int:
+    """Inserts rows into a table in one transaction and returns the number of batches."""
+    batch_size = INSERT_BATCH_SIZES.get(engine.dialect.name, DEFAULT_INSERT_BATCH_SIZE)
+    table = _table(engine, table_name)
+    
+    # Reject columns the table doesn't have instead of silently dropping them
+    unknown_columns = set().union(*rows) - set(table.columns.keys())
+    if unknown_columns:
+        raise ValueError(f"Unknown columns for table {table_name}: {', '.join(sorted(unknown_columns))}")
+    
+    statement = table.insert()
+    
+    batches = 0
+    with engine.begin() as connection:
+        for start in range(0, len(rows), batch_size):
+            connection.execute(statement, rows[start:start + batch_size])
+            batches += 1
+    return batches
+
+# Helper function to serialize query results as an Arrow IPC stream
+def _to_arrow_ipc(columns: list, rows: list) -> str:
+    """Returns the rows as a base64-encoded Arrow IPC stream."""
+    values = list(zip(*rows)) if rows else [()] * len(columns)
+    table = pa.Table.from_arrays([pa.array(column) for column in values], names=columns)
+    
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return base64.b64encode(sink.getvalue().to_pybytes()).decode("ascii")
+
+# Helper function to describe a table and count its rows side by side
+def _describe_with_row_count(engine, inspector, table_name: str) -> tuple:
+    """Returns the _describe result and the _row_count result for a table."""
+    with ThreadPoolExecutor(max_workers=_metadata_workers(engine)) as executor:
+        describe_future = executor.submit(_describe, inspector, table_name)
+        row_count_future = executor.submit(_row_count, engine, table_name)
+        return describe_future.result(), row_count_future.result()
+
+# Helper function to find the first keyword of a statement without copying it
+def _leading_keyword(sql: str) -> str:
+    """Returns the casefolded first keyword of a SQL statement, skipping whitespace and comments."""
+    i, n = 0, len(sql)
+    while i < n:
+        if sql[i].isspace():
+            i += 1
+        elif sql.startswith("--", i):
+            end = sql.find("\n", i)
+            i = n if end == -1 else end + 1
+        elif sql.startswith("/*", i):
+            end = sql.find("*/", i + 2)
+            i = n if end == -1 else end + 2
+        else:
+            break
+    
+    start = i
+    while i < n and (sql[i].isalpha() or sql[i] == "_"):
+        i += 1
+    return sql[start:i].casefold()
+
+# Helper function to copy a result into or out of the result cache
+def _copy_result(result: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Returns a deep copy of result, or None if it is missing or can't be copied."""
+    if result is None:
+        return None
+    try:
+        return copy.deepcopy(result)
+    except (TypeError, copy.Error):
+        return None
+
+# Helper function to build the canonical text of a query for cache keys and display
+def _normalize(sql: str) -> str:
+    """Strips comments, collapses whitespace outside literals and uppercases reserved
+    keywords, so equivalent spellings of a query share one canonical text."""
+    sql = _TRAILING_RE.sub('', sql.strip())
+    
+    # Only trim text that sqlparse might tokenize differently from the database
+    if _DIALECT_TEXT_RE.search(sql):
+        return sql
+    
+    sql = sqlparse.format(sql, strip_comments=True, strip_whitespace=True)
+    parts = []
+    for ttype, value in sqlparse.lexer.tokenize(sql):
+        if ttype in sqlparse.tokens.Whitespace:
+            # Removed comments can leave runs of whitespace behind
+            if parts and parts[-1] == " ":
+                continue
+            value = " "
+        elif ttype in sqlparse.tokens.Keyword:
+            keyword = " ".join(value.lower().split())
+            if keyword in CANONICAL_KEYWORDS:
+                value = keyword.upper()
+        parts.append(value)
+    return _TRAILING_RE.sub('', "".join(parts))
+
+# Helper function to reflect a table once per connection and reuse the result
+@functools.lru_cache(maxsize=512)
+def _describe(inspector, table_name: str) -> tuple:
+    """Returns (columns, primary key columns, foreign keys, indexes) for a table."""
+    # Each reflection call checks out its own pooled connection, so run them side by side
+    with ThreadPoolExecutor(max_workers=_metadata_workers(inspector.bind)) as executor:
+        columns = executor.submit(inspector.get_columns, table_name)
+        pk_constraint = executor.submit(inspector.get_pk_constraint, table_name)
+        foreign_keys = executor.submit(inspector.get_foreign_keys, table_name)
+        indexes = executor.submit(inspector.get_indexes, table_name)
+        return (
+            columns.result(),
+            pk_constraint.result().get('constrained_columns', []),
+            foreign_keys.result(),
+            indexes.result()
+        )
+
+# Helper function to count the rows of a table on a connection of its own
+def _row_count(engine, table_name: str) -> tuple:
+    """Returns (row count, whether the count is an estimate) for a table."""
+    with engine.connect() as connection:
+        # Prefer catalog statistics over scanning the whole table
+        approx_query = _APPROX_COUNT.get(engine.dialect.name)
+        if approx_query is not None:
+            estimate = connection.execute(text(approx_query), {"t": table_name}).scalar()
+            # Tables that were never analyzed have no usable estimate
+            if estimate is not None and estimate >= 0:
+                return int(estimate), True
+        
+        # Count through the reflected table so the name is quoted by the dialect
+        query = select(func.count()).select_from(_table(engine, table_name))
+        return connection.execute(query).scalar() or 0, False
+
+# Helper function to reflect a table as a SQLAlchemy Table once per connection
+@functools.lru_cache(maxsize=512)
+def _table(engine, table_name: str) -> Table:
+    """Returns the reflected Table object for a table."""
+    return Table(table_name, MetaData(), autoload_with=engine)
+
+# Helper function to size the thread pool used for metadata lookups
+def _metadata_workers(engine) -> int:
+    """Returns how many metadata queries can run at once on an engine."""
+    # A StaticPool hands the same connection to every thread, so don't overlap queries on it
+    return 1 if isinstance(engine.pool, StaticPool) else METADATA_WORKERS
+
+# Helper function to drop cached schema metadata after the schema changes
+def invalidate_schema(connection_id: str) -> None:
+    """Clears the table description and reflection caches, which are shared by all
+    connections, and the inspector cache of the given connection."""
+    _describe.cache_clear()
+    _table.cache_clear()
+    connection_info = active_connections.get(connection_id)
+    if connection_info is not None:
+        connection_info["inspector"].clear_cache()
 
 # Allow direct execution of the server
 if __name__ == "__main__":